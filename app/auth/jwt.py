@@ -1,16 +1,33 @@
 """
 JWT Authentication utilities.
 """
+import hashlib
+import hmac
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+import jwt
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from app.config import settings
 
 security = HTTPBearer()
 
+# Settings read once at import instead of on every request
+_JWT_SECRET = settings.JWT_SECRET
+_JWT_ALGORITHM = settings.JWT_ALGORITHM
+_JWT_ALGORITHMS = [settings.JWT_ALGORITHM]
+_EXPIRATION_DELTA = timedelta(hours=settings.JWT_EXPIRATION_HOURS)
+
+# Decoded payloads keyed by SHA-256 of the raw token. Entries are also
+# checked against the token's own "exp" claim, so expired tokens are never
+# served from cache.
+_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+_token_cache_lock = threading.Lock()
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -21,23 +38,60 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=settings.JWT_EXPIRATION_HOURS)
+        expire = datetime.utcnow() + _EXPIRATION_DELTA
 
     to_encode.update({"exp": expire})
 
     encoded_jwt = jwt.encode(
         to_encode,
-        settings.JWT_SECRET,
-        algorithm=settings.JWT_ALGORITHM
+        _JWT_SECRET,
+        algorithm=_JWT_ALGORITHM
     )
 
     return encoded_jwt
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+def decode_token(token: str) -> dict:
+    """
+    Decodifica JWT token usando la cache dei token già verificati.
+
+    Raises:
+        jwt.InvalidTokenError: token non valido o scaduto.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+
+    payload = jwt.decode(
+        token,
+        _JWT_SECRET,
+        algorithms=_JWT_ALGORITHMS
+    )
+
+    # Only successfully decoded tokens reach the cache
+    with _token_cache_lock:
+        _token_cache[key] = payload
+
+    return payload
+
+
+async def verify_token(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> dict:
     """
     Verifica JWT token e ritorna payload.
+
+    Se JWTAuthMiddleware ha già verificato il token, usa `request.state.user`.
     """
+    payload = getattr(request.state, "user", None)
+    if payload is not None:
+        return payload
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -45,12 +99,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
     )
 
     try:
-        token = credentials.credentials
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALGORITHM]
-        )
+        payload = decode_token(credentials.credentials)
 
         username: str = payload.get("sub")
         if username is None:
@@ -58,7 +107,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
 
         return payload
 
-    except JWTError:
+    except jwt.InvalidTokenError:
         raise credentials_exception
 
 
@@ -66,7 +115,7 @@ def authenticate_user(username: str, password: str) -> bool:
     """
     Verifica credenziali utente API.
     """
-    return (
-        username == settings.API_USERNAME and
-        password == settings.API_PASSWORD
-    )
+    # Constant-time comparisons, both always evaluated (no short-circuit)
+    username_ok = hmac.compare_digest(username.encode(), settings.API_USERNAME.encode())
+    password_ok = hmac.compare_digest(password.encode(), settings.API_PASSWORD.encode())
+    return username_ok & password_ok
@@ -0,0 +1,54 @@
+"""
+JWT authentication middleware.
+"""
+from typing import Iterable, Optional
+
+import jwt
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.auth.jwt import decode_token
+
+
+class JWTAuthMiddleware:
+    """
+    Decodifica il bearer token una sola volta, all'inizio dello stack, ed
+    espone il payload come `request.state.user` per `verify_token`.
+
+    OPTIONS (CORS preflight) e i path pubblici passano senza alcun lavoro.
+    Token mancanti o non validi non vengono rifiutati qui: `verify_token`
+    continua a restituire i soliti 401/403.
+    """
+
+    def __init__(self, app: ASGIApp, public_paths: Iterable[str] = ("/", "/health")):
+        self.app = app
+        self.public_paths = frozenset(public_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] == "http"
+            and scope["method"] != "OPTIONS"
+            and scope["path"] not in self.public_paths
+        ):
+            payload = self._get_payload(scope)
+            if payload is not None:
+                scope.setdefault("state", {})["user"] = payload
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _get_payload(scope: Scope) -> Optional[dict]:
+        """Payload of a valid bearer token in the request, if any."""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    return None
+
+                try:
+                    payload = decode_token(token)
+                except jwt.InvalidTokenError:
+                    return None
+
+                return payload if payload.get("sub") is not None else None
+
+        return None
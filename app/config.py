@@ -2,8 +2,40 @@
 Configuration settings for Immobili Images API.
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from functools import cached_property
+from typing import List, Tuple
 import json
+import math
+import os
+
+
+def _cgroup_cpu_quota() -> float:
+    """CPU quota of the container (cgroup v2 cpu.max or v1 CFS), or inf if unlimited."""
+    try:
+        quota, period = open("/sys/fs/cgroup/cpu.max").read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            quota = open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read().strip()
+            period = open("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read().strip()
+        except OSError:
+            return math.inf
+
+    if quota in ("max", "-1"):
+        return math.inf
+    return int(quota) / int(period)
+
+
+def _available_cpus() -> int:
+    """CPUs this process may use: affinity / cpusets, capped by the cgroup quota (docker --cpus)."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    quota = _cgroup_cpu_quota()
+    if quota != math.inf:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
 
 
 class Settings(BaseSettings):
@@ -15,6 +47,10 @@ class Settings(BaseSettings):
     DB_HOST: str
     DB_PORT: int = 5432
     DB_NAME: str
+    # Total connections across all workers, split evenly between them
+    # (keep below PostgreSQL max_connections, default 100)
+    DB_MAX_CONNECTIONS: int = 60
+    DB_POOL_RECYCLE: int = 1800  # seconds
 
     # JWT
     JWT_SECRET: str
@@ -36,18 +72,44 @@ class Settings(BaseSettings):
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8002
+    WORKERS: int = 0  # 0 = one per available CPU
 
     # Rate Limiting
     RATE_LIMIT_REQUESTS_PER_MINUTE: int = 60
 
+    # Caching
+    STATS_CACHE_SECONDS: int = 60
+    HTTP_CACHE_MAX_AGE: int = 300
+
     @property
     def database_url(self) -> str:
         """PostgreSQL database URL (read-only)."""
-        return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
-    @property
+    @cached_property
+    def worker_count(self) -> int:
+        """
+        Uvicorn worker processes: WORKERS, or one per available CPU.
+        Capped at DB_MAX_CONNECTIONS, since every worker needs a connection.
+        """
+        if self.DEBUG:
+            return 1  # reload needs a single process
+        workers = self.WORKERS or _available_cpus()
+        return max(1, min(workers, self.DB_MAX_CONNECTIONS))
+
+    @cached_property
+    def db_pool_limits(self) -> Tuple[int, int]:
+        """
+        Per-worker (pool_size, max_overflow): all workers together open at
+        most DB_MAX_CONNECTIONS connections.
+        """
+        per_worker = max(1, self.DB_MAX_CONNECTIONS // self.worker_count)
+        pool_size = max(1, per_worker // 2)
+        return pool_size, per_worker - pool_size
+
+    @cached_property
     def cors_origins_list(self) -> List[str]:
-        """Parse CORS origins from JSON string."""
+        """Parse CORS origins from JSON string (once, on first access)."""
         try:
             return json.loads(self.CORS_ORIGINS)
         except:
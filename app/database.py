@@ -1,33 +1,34 @@
 """
 Database configuration (read-only access).
 """
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import AsyncGenerator
 
 from app.config import settings
 
+# Pool per worker: i worker insieme restano entro DB_MAX_CONNECTIONS
+pool_size, max_overflow = settings.db_pool_limits
+
 # Read-only engine
-engine = create_engine(
+engine = create_async_engine(
     settings.database_url,
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
+    pool_size=pool_size,
+    max_overflow=max_overflow,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    connect_args={"server_settings": {"default_transaction_read_only": "on"}},
     echo=settings.DEBUG
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 
-def get_db() -> Generator[Session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
-    Dependency per ottenere sessione database (read-only).
+    Dependency per ottenere sessione database async (read-only).
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
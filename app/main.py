@@ -6,7 +6,9 @@ Designed for embedding generation and content retrieval.
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
+from app.auth.middleware import JWTAuthMiddleware
 from app.config import settings
 from app.routers import auth, immobili
 
@@ -29,7 +31,8 @@ app = FastAPI(
     """,
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -41,6 +44,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Verify bearer tokens once, before dependency resolution
+app.add_middleware(JWTAuthMiddleware, public_paths=("/", "/health"))
+
 # Include routers
 app.include_router(auth.router, prefix=settings.API_V1_PREFIX)
 app.include_router(immobili.router, prefix=settings.API_V1_PREFIX)
@@ -70,5 +76,11 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        loop="uvloop",
+        http="httptools",
+        # One single-threaded worker per available CPU; reload needs a single process
+        workers=None if settings.DEBUG else settings.worker_count,
+        log_level="info" if settings.DEBUG else "warning",
+        access_log=settings.DEBUG
     )
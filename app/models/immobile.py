@@ -1,8 +1,10 @@
 """
 Immobile model (read-only, subset of fields).
 """
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, ARRAY
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, ARRAY, and_
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import deferred
 
 from app.database import Base
 
@@ -39,10 +41,24 @@ class Immobile(Base):
     # Images (legacy field)
     immagini_600 = Column(Text)
 
-    # AI Features
-    features_ai = Column(JSONB)
+    # AI Features (large JSONB: loaded only when a query undefers it)
+    features_ai = deferred(Column(JSONB))
 
     # Privacy flags
     is_attivo = Column(Boolean)
     is_ufficiale = Column(Boolean)
     is_riservato_direzione = Column(Boolean)
+
+    @hybrid_property
+    def is_public(self) -> bool:
+        """Visible through the public API (all privacy filters satisfied)."""
+        return bool(self.is_ufficiale and self.is_attivo and not self.is_riservato_direzione)
+
+    @is_public.expression
+    def is_public(cls):
+        # Same predicate as the idx_immobili_public* partial indexes
+        return and_(
+            cls.is_ufficiale == True,
+            cls.is_attivo == True,
+            cls.is_riservato_direzione == False
+        )
@@ -2,13 +2,40 @@
 Authentication router.
 """
 from datetime import timedelta
-from fastapi import APIRouter, HTTPException, status
+from typing import Any, Callable
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
 
 from app.schemas.auth import LoginRequest, TokenResponse
 from app.auth.jwt import authenticate_user, create_access_token
 from app.config import settings
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+
+class ORJSONRequest(Request):
+    """Request that parses JSON bodies with orjson."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so
+            # FastAPI still reports malformed bodies as validation errors
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """Route class that hands endpoints an ORJSONRequest."""
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await original_route_handler(ORJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=ORJSONRoute)
 
 
 @router.post("/login", response_model=TokenResponse)
@@ -1,12 +1,20 @@
 """
 Immobili router - Public access to properties with images.
 """
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, undefer
+from sqlalchemy import exists, func, select
+from typing import Any, AsyncIterator, Dict, List, Optional
+from collections import defaultdict
+import asyncio
+import hashlib
 import math
+import orjson
 
+from app.config import settings
 from app.database import get_db
 from app.models.immobile import Immobile
 from app.models.immagine import Immagine
@@ -20,69 +28,159 @@ from app.auth.jwt import verify_token
 
 router = APIRouter(prefix="/immobili", tags=["Immobili"])
 
+# Dataset statistics change slowly: keep them per worker for a short TTL
+_stats_cache: TTLCache = TTLCache(maxsize=1, ttl=settings.STATS_CACHE_SECONDS)
+_stats_lock = asyncio.Lock()
 
-def get_immobile_images(immobile: Immobile, db: Session) -> List[ImageSchema]:
-    """Get images from normalized table or legacy field."""
-    images = []
 
-    # Try normalized table first
-    db_images = db.query(Immagine).filter(
-        Immagine.id_immobile == immobile.id
-    ).order_by(Immagine.ordine).all()
+def has_images_clause():
+    """Filter for properties with legacy images or at least one normalized image."""
+    return (
+        (Immobile.immagini_600.isnot(None) & (Immobile.immagini_600 != "")) |
+        exists().where(Immagine.id_immobile == Immobile.id)
+    )
 
-    if db_images:
-        for img in db_images:
-            images.append(ImageSchema(
-                id=img.id,
-                url=img.url,
-                ordine=img.ordine
-            ))
-    elif immobile.immagini_600:
-        # Fallback to legacy field
-        for idx, img_url in enumerate(immobile.immagini_600.split(";")):
-            img_url = img_url.strip()
-            if img_url:
-                images.append(ImageSchema(
-                    id=None,
-                    url=img_url,
-                    ordine=idx
-                ))
-
-    return images
 
+async def get_images_by_immobile(immobile_ids: List[int], db: AsyncSession) -> Dict[int, List[Immagine]]:
+    """Load normalized images for many properties with a single query."""
+    images_by_id: Dict[int, List[Immagine]] = defaultdict(list)
 
-@router.get("/stats", response_model=StatsResponse, dependencies=[Depends(verify_token)])
-async def get_stats(db: Session = Depends(get_db)):
+    if not immobile_ids:
+        return images_by_id
+
+    db_images = await db.execute(
+        select(Immagine).where(
+            Immagine.id_immobile.in_(immobile_ids)
+        ).order_by(Immagine.id_immobile, Immagine.ordine)
+    )
+
+    for img in db_images.scalars():
+        images_by_id[img.id_immobile].append(img)
+
+    return images_by_id
+
+
+def get_immobile_images(immobile: Immobile, db_images: List[Immagine]) -> List[Dict[str, Any]]:
+    """Get images from prefetched normalized rows or legacy field."""
+    if db_images:
+        return [
+            {"id": img.id, "url": img.url, "ordine": img.ordine}
+            for img in db_images
+        ]
+
+    if immobile.immagini_600:
+        # Fallback to legacy field (ordine keeps the position in the raw list)
+        return [
+            {"id": None, "url": img_url, "ordine": idx}
+            for idx, img_url in enumerate(map(str.strip, immobile.immagini_600.split(";")))
+            if img_url
+        ]
+
+    return []
+
+
+def immobile_to_dict(
+    immobile: Immobile,
+    images: List[Dict[str, Any]],
+    include_ai: bool = True
+) -> Dict[str, Any]:
     """
-    Get dataset statistics.
+    Serialize an Immobile row in the ImmobileSchema response shape (by alias).
 
-    **Auth required:** JWT Bearer token
+    Endpoints return these dicts as ORJSONResponse, skipping response_model
+    validation for trusted DB rows; the schemas still document the output.
+    """
+    return {
+        "id": immobile.id,
+        "codice_dam": immobile.codice_dam,
+        "titolo": immobile.titolo,
+        "tipo_immobile": immobile.tipo_immobile,
+        "descrizione_web_breve_it": immobile.descrizione_web_breve_it,
+        "descrizione_web_estesa_it": immobile.descrizione_web_estesa_it,
+        "comune": immobile.comune,
+        "localita": immobile.localita,
+        "via": immobile.via,
+        "mq_commerciali": immobile.mq_commerciali,
+        "camere_da_letto": immobile.camere_da_letto,
+        "bagni": immobile.bagni,
+        "prezzo_vendita": immobile.prezzo_vendita,
+        "immagini": images,
+        "features_ai": immobile.features_ai if include_ai else None
+    }
+
+
+async def stream_immobili_page(
+    header: Dict[str, Any],
+    immobili: List[Immobile],
+    images_by_id: Dict[int, List[Immagine]],
+    include_ai: bool
+) -> AsyncIterator[bytes]:
+    """
+    Yield an ImmobileListResponse as JSON fragments, one property at a time,
+    so each item is serialized and sent without building the whole page.
+    """
+    # '{"total":...,"total_pages":...' + ',"immobili":['
+    yield orjson.dumps(header)[:-1] + b',"immobili":['
+
+    for idx, immobile in enumerate(immobili):
+        images = get_immobile_images(immobile, images_by_id.get(immobile.id, []))
+        item = orjson.dumps(immobile_to_dict(immobile, images, include_ai))
+        yield b"," + item if idx else item
+
+    yield b"]}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+
+    return False
+
+
+def cached_json_response(request: Request, content: Any) -> Response:
+    """
+    JSON response with ETag (hash of the body) and Cache-Control.
+    Returns 304 Not Modified when the client already has this version.
     """
+    response = ORJSONResponse(content)
+    etag = f'"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.HTTP_CACHE_MAX_AGE}"
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return response
+
+
+async def compute_stats(db: AsyncSession) -> StatsResponse:
+    """Run the aggregate queries behind the stats endpoint."""
     # Query public properties only
-    query = db.query(Immobile).filter(
-        Immobile.is_ufficiale == True,
-        Immobile.is_attivo == True,
-        Immobile.is_riservato_direzione == False
-    )
+    query = select(func.count(Immobile.id)).where(Immobile.is_public)
 
-    total = query.count()
+    total = await db.scalar(query)
 
     # Count with images
-    con_foto = query.filter(
-        (Immobile.immagini_600.isnot(None) & (Immobile.immagini_600 != "")) |
-        Immobile.id.in_(db.query(Immagine.id_immobile).distinct())
-    ).count()
+    con_foto = await db.scalar(query.where(
+        has_images_clause()
+    ))
 
     # Tipologie
     tipologie = {}
-    for tipo, count in db.query(
+    rows = await db.execute(select(
         Immobile.tipo_immobile,
         func.count(Immobile.id)
-    ).filter(
-        Immobile.is_ufficiale == True,
-        Immobile.is_attivo == True,
-        Immobile.is_riservato_direzione == False
-    ).group_by(Immobile.tipo_immobile).all():
+    ).where(Immobile.is_public).group_by(Immobile.tipo_immobile))
+    for tipo, count in rows:
         if tipo:
             tipologie[tipo] = count
 
@@ -96,6 +194,25 @@ async def get_stats(db: Session = Depends(get_db)):
     )
 
 
+@router.get("/stats", response_model=StatsResponse, dependencies=[Depends(verify_token)])
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Get dataset statistics.
+
+    **Auth required:** JWT Bearer token
+
+    Cached per worker for `STATS_CACHE_SECONDS`.
+    """
+    # Lock so concurrent misses compute the stats only once
+    async with _stats_lock:
+        stats = _stats_cache.get("stats")
+        if stats is None:
+            stats = await compute_stats(db)
+            _stats_cache["stats"] = stats
+
+    return stats
+
+
 @router.get("", response_model=ImmobileListResponse, dependencies=[Depends(verify_token)])
 async def list_immobili(
     page: int = Query(1, ge=1, description="Page number"),
@@ -103,7 +220,8 @@ async def list_immobili(
     tipo_immobile: Optional[str] = Query(None, description="Filter by type"),
     comune: Optional[str] = Query(None, description="Filter by municipality"),
     con_immagini: bool = Query(False, description="Only with images"),
-    db: Session = Depends(get_db)
+    include_ai: bool = Query(True, description="Include AI features"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     List public properties with images and AI descriptions.
@@ -118,126 +236,112 @@ async def list_immobili(
 
     **Returns:**
     - Paginated list with images and AI features
+      (`include_ai=false` omits `features_ai` and skips loading it)
     """
     # Base query with privacy filters
-    query = db.query(Immobile).filter(
-        Immobile.is_ufficiale == True,
-        Immobile.is_attivo == True,
-        Immobile.is_riservato_direzione == False
-    )
+    query = select(Immobile).where(Immobile.is_public)
 
     # Apply filters
     if tipo_immobile:
-        query = query.filter(Immobile.tipo_immobile.ilike(f"%{tipo_immobile}%"))
+        query = query.where(Immobile.tipo_immobile.ilike(f"%{tipo_immobile}%"))
 
     if comune:
-        query = query.filter(Immobile.comune.ilike(f"%{comune}%"))
+        query = query.where(Immobile.comune.ilike(f"%{comune}%"))
 
     if con_immagini:
-        query = query.filter(
-            (Immobile.immagini_600.isnot(None) & (Immobile.immagini_600 != "")) |
-            Immobile.id.in_(db.query(Immagine.id_immobile).distinct())
+        query = query.where(
+            has_images_clause()
         )
 
-    # Count total
-    total = query.count()
-    total_pages = math.ceil(total / page_size)
+    if include_ai:
+        query = query.options(undefer(Immobile.features_ai))
 
-    # Paginate
+    # Paginate, counting the total in the same query with a window function.
+    # Stable order: pages fetched by separate requests must not overlap or skip rows.
     offset = (page - 1) * page_size
-    immobili = query.offset(offset).limit(page_size).all()
-
-    # Build response with images
-    result = []
-    for immobile in immobili:
-        images = get_immobile_images(immobile, db)
-
-        result.append(ImmobileSchema(
-            id=immobile.id,
-            codice_dam=immobile.codice_dam,
-            titolo=immobile.titolo,
-            tipo_immobile=immobile.tipo_immobile,
-            descrizione_web_breve_it=immobile.descrizione_web_breve_it,
-            descrizione_web_estesa_it=immobile.descrizione_web_estesa_it,
-            comune=immobile.comune,
-            localita=immobile.localita,
-            via=immobile.via,
-            mq_commerciali=immobile.mq_commerciali,
-            camere_da_letto=immobile.camere_da_letto,
-            bagni=immobile.bagni,
-            prezzo_vendita=immobile.prezzo_vendita,
-            immagini=images,
-            features_ai=immobile.features_ai
-        ))
-
-    return ImmobileListResponse(
-        total=total,
-        page=page,
-        page_size=page_size,
-        total_pages=total_pages,
-        immobili=result
+    rows = (await db.execute(query.add_columns(
+        func.count().over().label("total")
+    ).order_by(Immobile.id).offset(offset).limit(page_size))).all()
+
+    if rows:
+        total = rows[0].total
+    elif offset:
+        # Page past the end: no row carries the window count
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    else:
+        total = 0
+    total_pages = math.ceil(total / page_size)
+
+    immobili = [row[0] for row in rows]
+
+    # Load images for the whole page in one query
+    images_by_id = await get_images_by_immobile([immobile.id for immobile in immobili], db)
+
+    # Stream the response with images, serializing one property at a time
+    header = {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": total_pages
+    }
+    return StreamingResponse(
+        stream_immobili_page(header, immobili, images_by_id, include_ai),
+        media_type="application/json"
     )
 
 
 @router.get("/{immobile_id}", response_model=ImmobileSchema, dependencies=[Depends(verify_token)])
 async def get_immobile(
     immobile_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get single property with all images and AI features.
 
     **Auth required:** JWT Bearer token
+
+    Supports `ETag` / `If-None-Match` (304 Not Modified).
     """
-    immobile = db.query(Immobile).filter(
+    immobile = await db.scalar(select(Immobile).options(
+        undefer(Immobile.features_ai)
+    ).where(
         Immobile.id == immobile_id,
-        Immobile.is_ufficiale == True,
-        Immobile.is_attivo == True,
-        Immobile.is_riservato_direzione == False
-    ).first()
+        Immobile.is_public
+    ).limit(1))
 
     if not immobile:
         raise HTTPException(status_code=404, detail="Property not found or not public")
 
-    images = get_immobile_images(immobile, db)
-
-    return ImmobileSchema(
-        id=immobile.id,
-        codice_dam=immobile.codice_dam,
-        titolo=immobile.titolo,
-        tipo_immobile=immobile.tipo_immobile,
-        descrizione_web_breve_it=immobile.descrizione_web_breve_it,
-        descrizione_web_estesa_it=immobile.descrizione_web_estesa_it,
-        comune=immobile.comune,
-        localita=immobile.localita,
-        via=immobile.via,
-        mq_commerciali=immobile.mq_commerciali,
-        camere_da_letto=immobile.camere_da_letto,
-        bagni=immobile.bagni,
-        prezzo_vendita=immobile.prezzo_vendita,
-        immagini=images,
-        features_ai=immobile.features_ai
-    )
+    images_by_id = await get_images_by_immobile([immobile.id], db)
+    images = get_immobile_images(immobile, images_by_id.get(immobile.id, []))
+
+    return cached_json_response(request, immobile_to_dict(immobile, images))
 
 
 @router.get("/{immobile_id}/immagini", response_model=List[ImageSchema], dependencies=[Depends(verify_token)])
 async def get_immobile_images_only(
     immobile_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get only images for a property (lightweight).
 
     **Auth required:** JWT Bearer token
+
+    Supports `ETag` / `If-None-Match` (304 Not Modified).
     """
-    immobile = db.query(Immobile).filter(
+    # Only the columns needed to resolve images
+    immobile = await db.scalar(select(Immobile).options(
+        load_only(Immobile.id, Immobile.immagini_600)
+    ).where(
         Immobile.id == immobile_id,
-        Immobile.is_ufficiale == True,
-        Immobile.is_attivo == True,
-        Immobile.is_riservato_direzione == False
-    ).first()
+        Immobile.is_public
+    ).limit(1))
 
     if not immobile:
         raise HTTPException(status_code=404, detail="Property not found or not public")
 
-    return get_immobile_images(immobile, db)
+    images_by_id = await get_images_by_immobile([immobile.id], db)
+    return cached_json_response(request, get_immobile_images(immobile, images_by_id.get(immobile.id, [])))
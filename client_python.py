@@ -13,24 +13,333 @@ Uso:
 
     # Cerca immagini per query testuale
     results = gateway.search_images("villa con piscina vista mare")
+
+HTTP/2 (usato verso host HTTPS, es. CDN immagini): pip install httpx[http2]
+Cache embeddings immagini (LMDB): pip install lmdb
 """
+import functools
+import hashlib
+import importlib.util
 import os
 import json
+import pickle
+import time
+import warnings
 import httpx
 import numpy as np
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Union
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # Configurazione API
 API_BASE_URL = os.getenv("IMAGE_API_URL", "http://85.215.222.63:8002/api/v1")
 API_USERNAME = os.getenv("IMAGE_API_USER", "public_api")
 API_PASSWORD = os.getenv("IMAGE_API_PASS", "WyaJrRCUC0dyC//pLVM3Qmdvj+wIDM/M")
 
+# HTTP/2 disponibile solo con il pacchetto opzionale h2 (httpx[http2])
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
 # Cache per token e embeddings
 CACHE_DIR = Path(__file__).parent / "cache" / "images"
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+# CLIP (clip-ViT-B-32)
+EMBEDDING_DIM = 512
+# Batch size fisso: batch diversi danno piccole differenze numeriche (padding)
+TEXT_BATCH_SIZE = 64
+# Testi per encode durante la costruzione dell'indice (scritti su disco a ogni blocco)
+INDEX_ENCODE_CHUNK = TEXT_BATCH_SIZE * 16
+# Il text encoder CLIP vede al massimo 77 token (~4 caratteri/token): il testo oltre
+# viene scartato dal tokenizer. Tagliare prima evita di tokenizzare e paddare testo inutile
+# (margine ampio per non perdere token utili).
+CLIP_TEXT_MAX_CHARS = 400
+# Cache embeddings di testi singoli: LRU in memoria + file .npy (chiave sha1 del testo)
+TEXT_CACHE_SIZE = 4096
+TEXT_CACHE_DIR = CACHE_DIR / "text"
+
+# Pagine richieste in parallelo da get_all_immobili
+PAGE_SIZE_MAX = 100
+PAGE_FETCH_WORKERS = 8
+
+# Download immagini in parallelo e batch per l'encode CLIP delle immagini
+IMAGE_DOWNLOAD_WORKERS = 8
+IMAGE_BATCH_SIZE = 32
+# Lato corto dell'input del vision encoder CLIP (ridimensionamento del processor)
+CLIP_IMAGE_SIZE = 224
+
+# Backend di ricerca: "numpy" (default), "faiss" (pip install faiss-cpu)
+# o "numba" (pip install numba, solo con IMAGE_EMBED_DTYPE=float32).
+# Oltre FAISS_HNSW_THRESHOLD righe l'indice FAISS è HNSW (approssimato) invece che esatto.
+SEARCH_BACKEND = os.getenv("IMAGE_SEARCH_BACKEND", "numpy")
+FAISS_HNSW_THRESHOLD = 50000
+FAISS_INDEX_FILE = CACHE_DIR / "faiss.index"
+
+# Formato indice su disco: cambia quando gli embeddings salvati cambiano forma
+# (v2: embeddings L2-normalizzati). Indici di versione diversa vengono ricostruiti.
+INDEX_VERSION = 2
+INDEX_FILE = CACHE_DIR / "embeddings_index.pkl"
+INDEX_JSON_FILE = CACHE_DIR / "embeddings_index.json"  # solo con debug_json
+EMBEDDINGS_FILE = CACHE_DIR / "embeddings.npy"
+BUILD_LOG_FILE = CACHE_DIR / "build_log.json"
+
+# Precisione degli embeddings su disco e in RAM. IMAGE_EMBED_DTYPE=float16 dimezza
+# file e RAM, ma ogni ricerca è più lenta: BLAS non ha kernel float16 e le righe
+# vanno convertite in float32 a ogni query (vedi _similarities).
+EMBED_DTYPE = np.dtype(os.getenv("IMAGE_EMBED_DTYPE", "float32"))
+
+if SEARCH_BACKEND == "numba" and EMBED_DTYPE != np.float32:
+    # Il kernel legge float32: convertire float16 a ogni query annullerebbe la fusione
+    warnings.warn("IMAGE_SEARCH_BACKEND=numba richiede IMAGE_EMBED_DTYPE=float32: ricerca con NumPy")
+
+# Embeddings delle immagini in un unico database LMDB (chiave sha1 dell'URL,
+# valore EMBEDDING_DIM x EMBED_DTYPE). Un file per dtype: valori di dimensione fissa.
+IMAGE_EMBEDDINGS_DB = CACHE_DIR / f"img_embeds_{EMBED_DTYPE.name}.lmdb"
+IMAGE_EMBEDDINGS_DB_MAP_SIZE = 10 << 30
+# Sotto-database con la cache precedente (un .npy per immagine, chiave nome file dell'URL)
+LEGACY_IMAGE_DB_NAME = b"legacy_by_filename"
+# Righe per blocco quando gli embeddings float16 vengono convertiti per BLAS
+# (solo con IMAGE_EMBED_DTYPE=float16)
+SIMILARITY_BLOCK_ROWS = 16384
+
+
+@functools.lru_cache(maxsize=1)
+def _clip_singleton():
+    """Modello CLIP condiviso da tutte le istanze di ImageGateway (caricato una volta)."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("Installa sentence-transformers: pip install sentence-transformers")
+
+    model = SentenceTransformer('clip-ViT-B-32')
+    print("Modello CLIP caricato")
+    return model
+
+
+@functools.lru_cache(maxsize=1)
+def _image_embeddings_db() -> tuple:
+    """
+    (ambiente LMDB, sotto-database legacy) della cache embeddings immagini.
+    Aperto una volta per processo; all'apertura migra i file della cache precedente.
+    """
+    try:
+        import lmdb
+    except ImportError:
+        raise ImportError("Installa lmdb: pip install lmdb")
+
+    env = lmdb.open(str(IMAGE_EMBEDDINGS_DB), map_size=IMAGE_EMBEDDINGS_DB_MAP_SIZE, max_dbs=1)
+    legacy_db = env.open_db(LEGACY_IMAGE_DB_NAME)
+    _migrate_legacy_image_cache(env, legacy_db)
+    return env, legacy_db
+
+
+def _migrate_legacy_image_cache(env, legacy_db):
+    """
+    Importa i file .npy per immagine della cache precedente nel sotto-database
+    legacy e li rimuove (dopo la prima volta non ce ne sono più da leggere).
+
+    Quei file sono nominati col nome file dell'URL, non con l'URL intero:
+    restano indicizzati così, e due URL con lo stesso nome file li condividono
+    come con la cache precedente.
+    """
+    # embeddings*.npy sono i file dell'indice testuale, non della cache immagini
+    legacy_files = [
+        path for path in CACHE_DIR.glob("*.npy")
+        if not path.name.startswith("embeddings")
+    ]
+    if not legacy_files:
+        return
+
+    with env.begin(write=True) as txn:
+        for path in legacy_files:
+            try:
+                embedding = np.load(path)
+            except (OSError, ValueError):
+                continue  # file illeggibile o già migrato da un altro processo
+            txn.put(path.stem.encode(), embedding.astype(EMBED_DTYPE).tobytes(), db=legacy_db)
+
+    for path in legacy_files:
+        path.unlink(missing_ok=True)
+
+
+def _image_cache_key(image_url: str) -> bytes:
+    """Chiave LMDB per l'embedding di un'immagine."""
+    return hashlib.sha1(image_url.encode()).digest()
+
+
+def _legacy_image_cache_key(image_url: str) -> bytes:
+    """Chiave nel sotto-database legacy (nome file dell'URL, come la cache precedente)."""
+    return image_url.split("/")[-1].encode()
+
+
+def _resize_for_clip(image):
+    """
+    Converte in RGB e porta il lato corto a CLIP_IMAGE_SIZE (bicubico, come il
+    processor CLIP). Eseguito nei thread di download (PIL rilascia il GIL):
+    all'encode arrivano immagini già decodificate e piccole.
+    """
+    from PIL import Image
+
+    image = image.convert("RGB")
+    width, height = image.size
+    short_side = min(width, height)
+    if short_side <= CLIP_IMAGE_SIZE:
+        return image
+
+    size = (
+        int(CLIP_IMAGE_SIZE * width / short_side),
+        int(CLIP_IMAGE_SIZE * height / short_side)
+    )
+    return image.resize(size, Image.BICUBIC)
+
+
+def _l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Normalizza le righe a norma unitaria (righe nulle restano nulle)."""
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def _similarities(embeddings: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Prodotto embeddings @ query in float32.
+
+    BLAS non ha kernel float16: gli embeddings float16 vengono convertiti a
+    blocchi di SIMILARITY_BLOCK_ROWS righe, senza copiare l'intera matrice.
+    La conversione costa più del prodotto stesso: float16 risparmia spazio,
+    non tempo di ricerca.
+    """
+    if embeddings.dtype == np.float32:
+        return embeddings @ query
+
+    similarities = np.empty(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), SIMILARITY_BLOCK_ROWS):
+        block = embeddings[start:start + SIMILARITY_BLOCK_ROWS].astype(np.float32)
+        similarities[start:start + len(block)] = block @ query
+    return similarities
+
+
+def _filter_columns(metadata: List[dict]) -> Dict[str, np.ndarray]:
+    """Colonne dei filtri di ricerca come array NumPy (calcolate una volta per indice)."""
+    return {
+        "tipo": np.array([(m.get("tipo") or "").lower() for m in metadata], dtype=str),
+        "comune": np.array([(m.get("comune") or "").lower() for m in metadata], dtype=str),
+        "prezzo": np.array([m.get("prezzo") or np.inf for m in metadata], dtype=np.float64),
+    }
+
+
+def _filter_mask(columns: Dict[str, np.ndarray], filters: dict) -> np.ndarray:
+    """Maschera booleana delle righe che soddisfano i filtri (tipo, comune, prezzo_max)."""
+    mask = np.ones(len(columns["prezzo"]), dtype=bool)
+
+    if "tipo" in filters:
+        mask &= np.char.find(columns["tipo"], filters["tipo"].lower()) >= 0
+
+    if "comune" in filters:
+        mask &= np.char.find(columns["comune"], filters["comune"].lower()) >= 0
+
+    if "prezzo_max" in filters:
+        mask &= columns["prezzo"] <= filters["prezzo_max"]
+
+    return mask
+
+
+def _read_index_files() -> Optional[tuple]:
+    """
+    (embeddings, metadata) dell'indice su disco, o None se assente, di versione
+    diversa o non coerente (es. build interrotto tra la scrittura dei due file).
+    """
+    if not (INDEX_FILE.exists() and EMBEDDINGS_FILE.exists()):
+        return None
+
+    try:
+        # File locale scritto da build_embeddings_index
+        with open(INDEX_FILE, "rb") as f:
+            index_data = pickle.load(f)
+
+        # Memory-mapped (sola lettura): le pagine vengono caricate solo quando usate
+        embeddings = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+
+    if not isinstance(index_data, dict) or index_data.get("version") != INDEX_VERSION:
+        return None
+
+    if len(embeddings) != len(index_data["metadata"]):
+        return None
+
+    return embeddings, index_data["metadata"]
+
+
+def _load_faiss_index(embeddings: np.ndarray, rebuild: bool = False):
+    """
+    Indice FAISS a prodotto interno sugli embeddings normalizzati.
+    Riusa FAISS_INDEX_FILE se allineato agli embeddings, altrimenti lo ricostruisce.
+    """
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError("Installa faiss: pip install faiss-cpu")
+
+    if not rebuild and FAISS_INDEX_FILE.exists():
+        faiss_index = faiss.read_index(str(FAISS_INDEX_FILE))
+        if faiss_index.ntotal == len(embeddings):
+            return faiss_index
+
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    dim = vectors.shape[1]
+
+    if len(vectors) > FAISS_HNSW_THRESHOLD:
+        faiss_index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+    else:
+        faiss_index = faiss.IndexFlatIP(dim)
+
+    faiss_index.add(vectors)
+    faiss.write_index(faiss_index, str(FAISS_INDEX_FILE))
+    return faiss_index
+
+
+@functools.lru_cache(maxsize=1)
+def _numba_similarities():
+    """
+    Kernel Numba (compilato alla prima ricerca) per indici float32: prodotto
+    scalare e filtro in un solo passaggio parallelo sulle righe.
+    Le righe escluse dalla maschera hanno score -inf.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        raise ImportError("Installa numba: pip install numba")
+
+    # Solo riassociazione e FMA (somma vettorizzata): senza "ninf", -inf resta ben definito
+    @njit(parallel=True, fastmath={"contract", "reassoc"})
+    def masked_similarities(embeddings, query, mask):
+        n, dim = embeddings.shape
+        scores = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            if mask[i]:
+                score = np.float32(0.0)
+                for j in range(dim):
+                    score += embeddings[i, j] * query[j]
+                scores[i] = score
+            else:
+                scores[i] = -np.inf
+        return scores
+
+    return masked_similarities
+
+
+def _top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+    """Indici dei k valori più alti, in ordine decrescente (selezione O(N))."""
+    k = min(k, similarities.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    candidates = np.argpartition(-similarities, k - 1)[:k]
+    return candidates[np.argsort(-similarities[candidates])]
+
 
 class ImageGateway:
     """Client per l'API Immobili con immagini."""
@@ -38,14 +347,18 @@ class ImageGateway:
     def __init__(self, base_url: str = None):
         self.base_url = base_url or API_BASE_URL
         self._token: Optional[str] = None
-        self._token_expires: Optional[datetime] = None
-        self._client = httpx.Client(timeout=30.0)
-        self._embeddings_cache: Dict[str, np.ndarray] = {}
+        # Scadenza su time.monotonic(): confronto tra float, immune a cambi d'orologio
+        self._token_expires: Optional[float] = None
+        # Client persistente: connessioni keep-alive riusate (e multiplexate con HTTP/2)
+        self._client = httpx.Client(http2=HTTP2_ENABLED, limits=HTTP_LIMITS, timeout=30.0)
+        self._embeddings_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
         self._model = None
+        # Indice caricato da build_embeddings_index, riusato tra le ricerche
+        self._index: Optional[Dict[str, Any]] = None
 
     def _get_token(self) -> str:
         """Ottieni o rinnova token JWT."""
-        if self._token and self._token_expires and datetime.now() < self._token_expires:
+        if self._token and self._token_expires and time.monotonic() < self._token_expires:
             return self._token
 
         response = self._client.post(
@@ -56,7 +369,8 @@ class ImageGateway:
         data = response.json()
 
         self._token = data["access_token"]
-        self._token_expires = datetime.now() + timedelta(seconds=data.get("expires_in", 604800) - 3600)
+        # Rinnovo con un'ora di margine sulla scadenza del server
+        self._token_expires = time.monotonic() + data.get("expires_in", 604800) - 3600
 
         return self._token
 
@@ -110,106 +424,268 @@ class ImageGateway:
         return response.json()
 
     def get_all_immobili(self, con_immagini: bool = True) -> List[dict]:
-        """Fetch tutti gli immobili (paginazione automatica)."""
-        all_immobili = []
-        page = 1
-
-        while True:
-            data = self.get_immobili(page=page, page_size=100, con_immagini=con_immagini)
-            immobili = data.get("immobili", [])
-
-            if not immobili:
-                break
-
-            all_immobili.extend(immobili)
-
-            if len(immobili) < 100:
-                break
+        """
+        Fetch tutti gli immobili (paginazione automatica).
 
-            page += 1
+        La prima pagina indica total_pages: le successive vengono richieste
+        in parallelo (PAGE_FETCH_WORKERS thread), mantenendo l'ordine.
+        """
+        data = self.get_immobili(page=1, page_size=PAGE_SIZE_MAX, con_immagini=con_immagini)
+        immobili = data.get("immobili", [])
+        all_immobili = list(immobili)
+        total_pages = data.get("total_pages")
+
+        if total_pages is None:
+            # Totali non disponibili: paginazione sequenziale
+            page = 1
+            while len(immobili) == PAGE_SIZE_MAX:
+                page += 1
+                data = self.get_immobili(page=page, page_size=PAGE_SIZE_MAX, con_immagini=con_immagini)
+                immobili = data.get("immobili", [])
+                all_immobili.extend(immobili)
+
+        elif total_pages > 1:
+            # Il token è già in cache dalla prima richiesta: i thread lo riusano
+            with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+                pages = executor.map(
+                    lambda page: self.get_immobili(
+                        page=page, page_size=PAGE_SIZE_MAX, con_immagini=con_immagini
+                    ),
+                    range(2, total_pages + 1)
+                )
+                for data in pages:
+                    all_immobili.extend(data.get("immobili", []))
 
         return all_immobili
 
     def _load_clip_model(self):
         """Carica modello CLIP per embeddings."""
         if self._model is None:
-            try:
-                from sentence_transformers import SentenceTransformer
-                self._model = SentenceTransformer('clip-ViT-B-32')
-                print("Modello CLIP caricato")
-            except ImportError:
-                raise ImportError("Installa sentence-transformers: pip install sentence-transformers")
+            self._model = _clip_singleton()
         return self._model
 
-    def generate_text_embedding(self, text: str) -> np.ndarray:
-        """Genera embedding per testo con CLIP."""
-        model = self._load_clip_model()
-        return model.encode(text, convert_to_numpy=True)
+    def generate_text_embedding(self, text: Union[str, List[str]]) -> np.ndarray:
+        """
+        Genera embedding per testo con CLIP (testi tagliati a CLIP_TEXT_MAX_CHARS).
 
-    def generate_image_embedding(self, image_url: str) -> np.ndarray:
-        """Genera embedding per immagine con CLIP."""
+        Con una lista di testi esegue un unico encode a batch
+        (TEXT_BATCH_SIZE) e ritorna un array (N, dim), senza cache.
+        Un testo singolo passa dalla cache LRU in memoria e su disco.
+        """
+        if not isinstance(text, str):
+            model = self._load_clip_model()
+            return model.encode(
+                [t[:CLIP_TEXT_MAX_CHARS] for t in text],
+                batch_size=TEXT_BATCH_SIZE,
+                convert_to_numpy=True,
+                show_progress_bar=True
+            )
+
+        text = text[:CLIP_TEXT_MAX_CHARS]
+        cache_key = hashlib.sha1(text.encode()).hexdigest()
+
+        # Cache in memoria
+        embedding = self._embeddings_cache.get(cache_key)
+        if embedding is not None:
+            self._embeddings_cache.move_to_end(cache_key)
+            return embedding
+
+        # Cache su disco
+        cache_file = TEXT_CACHE_DIR / f"{cache_key}.npy"
+        if cache_file.exists():
+            embedding = np.load(cache_file)
+        else:
+            model = self._load_clip_model()
+            embedding = model.encode(text, convert_to_numpy=True)
+            TEXT_CACHE_DIR.mkdir(exist_ok=True)
+            np.save(cache_file, embedding)
+
+        # Condiviso tra chiamate: in sola lettura
+        embedding.flags.writeable = False
+        self._embeddings_cache[cache_key] = embedding
+        if len(self._embeddings_cache) > TEXT_CACHE_SIZE:
+            self._embeddings_cache.popitem(last=False)
+
+        return embedding
+
+    @staticmethod
+    def _read_image_cache(image_urls: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Embeddings in cache per gli URL dati (float32), letti in un'unica transazione.
+        Gli URL trovati solo nel sotto-database legacy vengono copiati sotto la
+        propria chiave; la voce legacy resta per altri URL con lo stesso nome file.
+        """
+        env, legacy_db = _image_embeddings_db()
+        cached: Dict[str, np.ndarray] = {}
+        migrated: Dict[str, np.ndarray] = {}
+
+        with env.begin() as txn:
+            for image_url in image_urls:
+                value = txn.get(_image_cache_key(image_url))
+                if value is None:
+                    value = txn.get(_legacy_image_cache_key(image_url), db=legacy_db)
+                    if value is None:
+                        continue
+                    migrated[image_url] = value
+
+                cached[image_url] = np.frombuffer(value, dtype=EMBED_DTYPE).astype(np.float32)
+
+        if migrated:
+            ImageGateway._write_image_cache({image_url: cached[image_url] for image_url in migrated})
+
+        return cached
+
+    @staticmethod
+    def _write_image_cache(embeddings: Dict[str, np.ndarray]):
+        """Salva embeddings immagini nel database LMDB (una transazione)."""
+        env, _ = _image_embeddings_db()
+        with env.begin(write=True) as txn:
+            for image_url, embedding in embeddings.items():
+                txn.put(_image_cache_key(image_url), embedding.astype(EMBED_DTYPE).tobytes())
+
+    def _download_image(self, image_url: str):
+        """Scarica un'immagine e ritorna un PIL.Image pronto per CLIP (_resize_for_clip)."""
         from PIL import Image
         from io import BytesIO
 
-        # Check cache
-        cache_key = image_url.split("/")[-1]
-        cache_file = CACHE_DIR / f"{cache_key}.npy"
+        response = self._client.get(image_url)
+        response.raise_for_status()
+        return _resize_for_clip(Image.open(BytesIO(response.content)))
 
-        if cache_file.exists():
-            return np.load(cache_file)
+    def generate_image_embedding(self, image_url: str) -> np.ndarray:
+        """Genera embedding per immagine con CLIP."""
+        # Check cache
+        embedding = self._read_image_cache([image_url]).get(image_url)
+        if embedding is not None:
+            return embedding
 
         # Download image
-        response = self._client.get(image_url)
-        response.raise_for_status()
-        image = Image.open(BytesIO(response.content))
+        image = self._download_image(image_url)
 
         # Generate embedding
         model = self._load_clip_model()
         embedding = model.encode(image, convert_to_numpy=True)
 
-        # Cache
-        np.save(cache_file, embedding)
+        # Cache (ritornato con la precisione salvata, come alle letture successive)
+        self._write_image_cache({image_url: embedding})
 
-        return embedding
+        return embedding.astype(EMBED_DTYPE).astype(np.float32)
 
-    def build_embeddings_index(self, force_rebuild: bool = False) -> Dict[str, Any]:
+    def generate_image_embeddings(
+        self,
+        image_urls: List[str],
+        batch_size: int = IMAGE_BATCH_SIZE
+    ) -> np.ndarray:
+        """
+        Genera embeddings per più immagini con CLIP.
+
+        Le immagini non in cache vengono elaborate a blocchi di batch_size:
+        scaricate, decodificate e ridimensionate in parallelo
+        (IMAGE_DOWNLOAD_WORKERS thread), poi codificate con un encode a batch.
+
+        Returns:
+            np.array (N, dim) nello stesso ordine di image_urls
+        """
+        if not image_urls:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+
+        # Check cache (URL duplicati scaricati una sola volta)
+        unique_urls = list(dict.fromkeys(image_urls))
+        embeddings = self._read_image_cache(unique_urls)
+        missing = [image_url for image_url in unique_urls if image_url not in embeddings]
+
+        if missing:
+            model = self._load_clip_model()
+
+            # Download e preprocessing in parallelo: rete e PIL fuori dal thread dell'encode.
+            # A blocchi, per tenere in memoria al più batch_size immagini.
+            with ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS) as executor:
+                for start in range(0, len(missing), batch_size):
+                    batch_urls = missing[start:start + batch_size]
+                    images = list(executor.map(self._download_image, batch_urls))
+                    new_embeddings = model.encode(images, batch_size=batch_size, convert_to_numpy=True)
+
+                    # Cache (ritornati con la precisione salvata, come alle letture successive)
+                    new_embeddings = dict(zip(batch_urls, new_embeddings))
+                    self._write_image_cache(new_embeddings)
+                    for image_url, embedding in new_embeddings.items():
+                        embeddings[image_url] = embedding.astype(EMBED_DTYPE).astype(np.float32)
+
+        return np.stack([embeddings[image_url] for image_url in image_urls])
+
+    def build_embeddings_index(
+        self,
+        force_rebuild: bool = False,
+        debug_json: bool = False,
+        full_rebuild: bool = False
+    ) -> Dict[str, Any]:
         """
         Costruisce indice embeddings per tutte le immagini.
         Usa le descrizioni AI come testo (più veloce) o le immagini stesse.
 
+        Con force_rebuild l'indice viene aggiornato in modo incrementale:
+        gli immobili vengono riscaricati ma solo le descrizioni nuove o
+        modificate (hash del testo) vengono ricodificate; full_rebuild
+        ricodifica tutto.
+
+        Metadata salvati in pickle (binario, caricamento veloce); con
+        debug_json viene scritta anche una copia JSON leggibile.
+
+        L'indice caricato o costruito resta in memoria per search_images.
+
         Returns:
             Dict con:
-            - embeddings: np.array (N, dim)
+            - embeddings: np.array (N, dim) EMBED_DTYPE, righe L2-normalizzate
             - metadata: List[dict] con info per ogni embedding
+            - filter_columns: Dict[str, np.array] colonne per i filtri di ricerca
+            - faiss_index: indice FAISS (solo con IMAGE_SEARCH_BACKEND=faiss)
         """
-        index_file = CACHE_DIR / "embeddings_index.json"
-        embeddings_file = CACHE_DIR / "embeddings.npy"
-
-        if not force_rebuild and index_file.exists() and embeddings_file.exists():
-            print("Caricando indice esistente...")
-            with open(index_file) as f:
-                metadata = json.load(f)
-            embeddings = np.load(embeddings_file)
-            return {"embeddings": embeddings, "metadata": metadata}
+        stored = _read_index_files()
+
+        if not force_rebuild:
+            if stored is not None and stored[0].dtype == EMBED_DTYPE:
+                print("Caricando indice esistente...")
+                self._index = self._make_index(*stored)
+                return self._index
+
+            if stored is not None:
+                # Es. indice float16 con IMAGE_EMBED_DTYPE=float32: embeddings riusati e convertiti
+                print(f"Indice in {stored[0].dtype}, conversione in {EMBED_DTYPE}...")
+            elif INDEX_FILE.exists():
+                print("Indice in formato precedente, ricostruzione...")
+
+        # Embeddings già calcolati per immobile: (riga nell'indice, hash del testo)
+        previous: Dict[Any, tuple] = {}
+        if stored is not None and not full_rebuild:
+            for position, row in enumerate(stored[1]):
+                if row.get("text_hash"):
+                    previous[row["immobile_id"]] = (position, row["text_hash"])
 
         print("Costruendo indice embeddings...")
         immobili = self.get_all_immobili(con_immagini=True)
 
-        embeddings_list = []
         metadata = []
+        reused = []  # (riga nuova, riga nell'indice precedente)
+        new_rows = []
+        new_texts = []
 
-        for idx, immobile in enumerate(immobili):
-            print(f"\r[{idx+1}/{len(immobili)}] {immobile.get('titolo', 'N/A')[:40]}...", end="")
-
+        for immobile in immobili:
             features_ai = immobile.get("features_ai", {})
             descrizione_visuale = features_ai.get("descrizione_visuale_completa", "")
 
             if not descrizione_visuale:
                 continue
 
-            # Genera embedding dalla descrizione visuale (text embedding)
-            embedding = self.generate_text_embedding(descrizione_visuale[:2000])
-            embeddings_list.append(embedding)
+            # Testo per l'embedding dalla descrizione visuale (encode a batch sotto)
+            text = descrizione_visuale[:CLIP_TEXT_MAX_CHARS]
+            text_hash = hashlib.sha1(text.encode()).hexdigest()
+
+            previous_row = previous.get(immobile.get("id"))
+            if previous_row is not None and previous_row[1] == text_hash:
+                reused.append((len(metadata), previous_row[0]))
+            else:
+                new_rows.append(len(metadata))
+                new_texts.append(text)
 
             # Salva metadata
             metadata.append({
@@ -224,18 +700,86 @@ class ImageGateway:
                     "piscina": features_ai.get("piscina_privata"),
                     "stile": features_ai.get("stile"),
                     "landmarks": features_ai.get("landmarks_visibili", [])
-                }
+                },
+                "text_hash": text_hash
             })
 
-        print("\nSalvando indice...")
-        embeddings_array = np.array(embeddings_list)
-        np.save(embeddings_file, embeddings_array)
-
-        with open(index_file, "w") as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        # Embeddings scritti direttamente in un .npy memory-mapped, a blocchi:
+        # nessuna copia completa della matrice in RAM. File temporaneo + replace
+        # perché l'indice precedente può essere ancora memory-mapped.
+        tmp_embeddings_file = EMBEDDINGS_FILE.with_name("embeddings.tmp.npy")
+        embeddings_out = np.lib.format.open_memmap(
+            tmp_embeddings_file,
+            mode="w+",
+            dtype=EMBED_DTYPE,
+            shape=(len(metadata), EMBEDDING_DIM)
+        )
 
-        print(f"Indice creato: {len(metadata)} immobili")
-        return {"embeddings": embeddings_array, "metadata": metadata}
+        for start in range(0, len(reused), INDEX_ENCODE_CHUNK):
+            rows, previous_rows = (
+                np.array(column) for column in zip(*reused[start:start + INDEX_ENCODE_CHUNK])
+            )
+            embeddings_out[rows] = stored[0][previous_rows]
+
+        # Avanzamento mostrato dalla progress bar dell'encode a batch
+        print(f"Generando embeddings: {len(new_texts)} descrizioni nuove o modificate, {len(reused)} invariate...")
+        for start in range(0, len(new_texts), INDEX_ENCODE_CHUNK):
+            chunk = slice(start, start + INDEX_ENCODE_CHUNK)
+            new_embeddings = self.generate_text_embedding(new_texts[chunk]).astype(np.float32, copy=False)
+            # Normalizzati una volta qui: in ricerca la similarità coseno è un prodotto scalare
+            embeddings_out[new_rows[chunk]] = _l2_normalize(new_embeddings)
+
+        print("Salvando indice...")
+        embeddings_out.flush()
+        del embeddings_out
+
+        # Anche il pickle via file temporaneo: entrambi i file sono completi
+        # prima di sostituire la coppia precedente
+        index_data = {"version": INDEX_VERSION, "normalized": True, "metadata": metadata}
+        tmp_index_file = INDEX_FILE.with_name("embeddings_index.tmp.pkl")
+        with open(tmp_index_file, "wb") as f:
+            pickle.dump(index_data, f, protocol=5)
+
+        # L'indice FAISS su disco descrive gli embeddings precedenti: rimosso con
+        # qualunque backend, così una ricerca faiss successiva non lo riusa
+        FAISS_INDEX_FILE.unlink(missing_ok=True)
+        os.replace(tmp_embeddings_file, EMBEDDINGS_FILE)
+        os.replace(tmp_index_file, INDEX_FILE)
+        embeddings_array = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+
+        if debug_json:
+            with open(INDEX_JSON_FILE, "w") as f:
+                json.dump(index_data, f, indent=2, ensure_ascii=False)
+
+        with open(BUILD_LOG_FILE, "w") as f:
+            json.dump({
+                "last_sync": datetime.now().isoformat(timespec="seconds"),
+                "immobili": len(metadata),
+                "encoded": len(new_texts),
+                "reused": len(reused)
+            }, f, indent=2)
+
+        print(f"Indice creato: {len(metadata)} immobili ({len(new_texts)} ricodificati)")
+        self._index = self._make_index(embeddings_array, metadata, rebuilt=True)
+        return self._index
+
+    def reload_index(self) -> Dict[str, Any]:
+        """Ricarica l'indice da disco (es. dopo un build-index di un altro processo)."""
+        self._index = None
+        return self.build_embeddings_index()
+
+    @staticmethod
+    def _make_index(embeddings: np.ndarray, metadata: List[dict], rebuilt: bool = False) -> Dict[str, Any]:
+        """Indice in memoria: embeddings, metadata e strutture derivate per la ricerca."""
+        return {
+            "embeddings": embeddings,
+            "metadata": metadata,
+            "filter_columns": _filter_columns(metadata),
+            "faiss_index": (
+                _load_faiss_index(embeddings, rebuild=rebuilt)
+                if SEARCH_BACKEND == "faiss" and len(embeddings) else None
+            )
+        }
 
     def search_images(
         self,
@@ -254,47 +798,52 @@ class ImageGateway:
         Returns:
             Lista di risultati con score e metadata
         """
-        # Carica o costruisci indice
-        index = self.build_embeddings_index()
+        # Indice in memoria, caricato o costruito alla prima ricerca
+        index = self._index if self._index is not None else self.build_embeddings_index()
         embeddings = index["embeddings"]
         metadata = index["metadata"]
 
-        # Genera embedding query
-        query_embedding = self.generate_text_embedding(query)
-
-        # Calcola similarità coseno
-        similarities = np.dot(embeddings, query_embedding) / (
-            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+        # Genera embedding query (normalizzato come l'indice)
+        query_embedding = _l2_normalize(
+            self.generate_text_embedding(query).astype(np.float32, copy=False)
         )
 
-        # Applica filtri
-        if filters:
-            mask = np.ones(len(metadata), dtype=bool)
-
-            if "tipo" in filters:
-                mask &= np.array([filters["tipo"].lower() in m.get("tipo", "").lower() for m in metadata])
-
-            if "comune" in filters:
-                mask &= np.array([filters["comune"].lower() in m.get("comune", "").lower() for m in metadata])
-
-            if "prezzo_max" in filters:
-                mask &= np.array([
-                    (m.get("prezzo") or float("inf")) <= filters["prezzo_max"]
-                    for m in metadata
-                ])
-
-            similarities = np.where(mask, similarities, -1)
-
-        # Top-K
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # Similarità coseno: l'indice è già normalizzato, basta un prodotto matrice-vettore.
+        # Con filtri si calcola solo sulle righe che li soddisfano; senza filtri,
+        # con IMAGE_SEARCH_BACKEND=faiss, la ricerca è delegata a FAISS.
+        # Con IMAGE_SEARCH_BACKEND=numba (indice float32) prodotto e filtro sono un unico kernel.
+        faiss_index = index["faiss_index"]
+        if faiss_index is not None and not filters:
+            scores, top_indices = faiss_index.search(query_embedding.reshape(1, -1), top_k)
+            # FAISS completa con indice -1 quando i risultati sono meno di top_k
+            found = top_indices[0] >= 0
+            top_indices, scores = top_indices[0][found], scores[0][found]
+        elif SEARCH_BACKEND == "numba" and embeddings.dtype == np.float32:
+            if filters:
+                mask = _filter_mask(index["filter_columns"], filters)
+            else:
+                mask = np.ones(len(embeddings), dtype=bool)
+            # Righe escluse a -inf: scartate sotto insieme agli score negativi
+            similarities = _numba_similarities()(embeddings, query_embedding, mask)
+            top_indices = _top_k(similarities, top_k)
+            scores = similarities[top_indices]
+        elif filters:
+            candidates = np.flatnonzero(_filter_mask(index["filter_columns"], filters))
+            similarities = _similarities(embeddings[candidates], query_embedding)
+            best = _top_k(similarities, top_k)
+            top_indices, scores = candidates[best], similarities[best]
+        else:
+            similarities = _similarities(embeddings, query_embedding)
+            top_indices = _top_k(similarities, top_k)
+            scores = similarities[top_indices]
 
         results = []
-        for idx in top_indices:
-            if similarities[idx] < 0:
+        for idx, score in zip(top_indices, scores):
+            if score < 0:
                 continue
 
             result = metadata[idx].copy()
-            result["score"] = float(similarities[idx])
+            result["score"] = float(score)
             results.append(result)
 
         return results
@@ -358,6 +907,21 @@ if __name__ == "__main__":
     parser.add_argument("--top", "-k", type=int, default=5, help="Numero risultati")
     parser.add_argument("--tipo", help="Filtro tipo immobile")
     parser.add_argument("--comune", help="Filtro comune")
+    parser.add_argument(
+        "--debug-json",
+        action="store_true",
+        help="build-index: scrive anche i metadata in JSON leggibile"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="build-index: ricodifica tutte le descrizioni (default: solo nuove o modificate)"
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="search: carica modello e indice una volta e legge altre query da stdin"
+    )
 
     args = parser.parse_args()
 
@@ -372,7 +936,7 @@ if __name__ == "__main__":
                 print(f"[{imm['id']}] {imm['titolo']} - {imm['comune']} ({len(imm.get('immagini', []))} foto)")
 
         elif args.command == "search":
-            if not args.query:
+            if not args.query and not args.preload:
                 print("Specifica --query")
                 exit(1)
 
@@ -382,16 +946,38 @@ if __name__ == "__main__":
             if args.comune:
                 filters["comune"] = args.comune
 
-            results = gateway.search_images(args.query, top_k=args.top, filters=filters or None)
-
-            print(f"\nRisultati per: '{args.query}'\n")
-            for r in results:
-                print(f"[{r['score']:.3f}] {r['titolo']} - {r['comune']}")
-                print(f"         Tipo: {r['tipo']}")
-                if r['immagini']:
-                    print(f"         Img:  {r['immagini'][0]}")
-                print()
+            if args.preload:
+                gateway._load_clip_model()
+                gateway.build_embeddings_index()
+
+            query = args.query
+            while True:
+                if query:
+                    results = gateway.search_images(query, top_k=args.top, filters=filters or None)
+
+                    print(f"\nRisultati per: '{query}'\n")
+                    for r in results:
+                        print(f"[{r['score']:.3f}] {r['titolo']} - {r['comune']}")
+                        print(f"         Tipo: {r['tipo']}")
+                        if r['immagini']:
+                            print(f"         Img:  {r['immagini'][0]}")
+                        print()
+
+                if not args.preload:
+                    break
+
+                # Modalità preload: altre query da stdin, riga vuota o EOF per uscire
+                try:
+                    query = input("query> ").strip()
+                except EOFError:
+                    break
+                if not query:
+                    break
 
         elif args.command == "build-index":
-            gateway.build_embeddings_index(force_rebuild=True)
+            gateway.build_embeddings_index(
+                force_rebuild=True,
+                debug_json=args.debug_json,
+                full_rebuild=args.full
+            )
             print("Indice costruito!")
@@ -0,0 +1,29 @@
+-- ========================================
+-- IMMOBILI IMAGES API - DATABASE INDEXES
+-- ========================================
+-- The API connects read-only: run this once with a privileged user, e.g.
+--   psql -h $DB_HOST -U postgres -d $DB_NAME -f sql/indexes.sql
+-- CONCURRENTLY avoids locking the tables; do not wrap in a transaction.
+
+-- Substring filters on list_immobili (ILIKE '%...%')
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_immobili_tipo_trgm
+    ON immobilpostgres USING gin (tipo_immobile gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_immobili_comune_trgm
+    ON immobilpostgres USING gin (comune gin_trgm_ops);
+
+-- Privacy filter applied by every endpoint (public properties only)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_immobili_public
+    ON immobilpostgres (id)
+    WHERE is_ufficiale = true AND is_attivo = true AND is_riservato_direzione = false;
+
+-- Group-by / filters on the public subset (get_stats tipologie)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_immobili_public_tipo
+    ON immobilpostgres (tipo_immobile)
+    WHERE is_ufficiale = true AND is_attivo = true AND is_riservato_direzione = false;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_immobili_public_comune
+    ON immobilpostgres (comune)
+    WHERE is_ufficiale = true AND is_attivo = true AND is_riservato_direzione = false;